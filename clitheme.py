@@ -11,40 +11,175 @@
 # * 原作者有权追究任何违反以上使用须知的使用
 
 import argparse
+import codecs
 import json
+import os
 import re
+import selectors
 import subprocess  # noqa: S404
 import sys
 import threading
+import time
+from collections import deque
+from collections.abc import Callable
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from re import Pattern
 from typing import Any, TextIO
 
+try:
+	from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+	import sre_parse
 
-# 预编译规则结构
+try:
+	import hyperscan
+except ImportError:
+	hyperscan = None
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+
+# 全局内联标志 (?aiLmsux) 只能出现在表达式开头,合并前需转换为作用域标志
+_GLOBAL_FLAGS_RE = re.compile(r"\(\?([aiLmsux]+)\)")
+# 替换模板中的转义: \g<name>、\g<N>、八进制转义 \NNN 以及分组引用 \N
+_TEMPLATE_ESCAPE_RE = re.compile(r"\\(?:g<([^>]*)>|([0-7]{3})|([1-9][0-9]?)|.)", re.DOTALL)
+_OCTDIGITS = frozenset("01234567")
+# 正则表达式元字符,不含这些字符的规则可以用 str.replace 做纯文本替换
+_METACHARS = frozenset(".^$*+?{}[]\\|()")
+# Python 允许省略重复次数下限 {,n},hyperscan 将其视为普通文本
+_OPEN_MIN_REPEAT_RE = re.compile(r"\{,(\d*)\}")
+# hyperscan 的字符属性表与 Python 不一致 (如较新的 Unicode 字符、\x1c-\x1f 空白): 预过滤时放宽为
+# 包含全部非 ASCII 字符的字符类,取反的字符类中收窄为 Python 语义下的 ASCII 部分
+_PCRE_WIDE_ESCAPES = {
+	"w": "\\w\x80-\U0010ffff",
+	"W": "\\W\x80-\U0010ffff",
+	"d": "\\d\x80-\U0010ffff",
+	"D": "\\D\x80-\U0010ffff",
+	"s": "\\s\\x1c-\\x1f\x80-\U0010ffff",
+	"S": "\\S\x80-\U0010ffff",
+}
+_PCRE_NARROW_ESCAPES = {"w": "0-9A-Za-z_", "d": "0-9", "s": r"\t-\r\x1c-\x20"}
+# 用于展开不含分组引用的模板片段(处理 \n、\\ 等转义)
+_EMPTY_MATCH = re.match("", "")
+# 单次从管道读取的最大字节数
+_READ_SIZE = 65536
+# 按行缓存替换结果的条目数,以及参与缓存的最大行长度
+_LINE_CACHE_SIZE = 1024
+_LINE_CACHE_MAX_LEN = 4096
+# Windows 上的管道无法被 select 监听,改用读取线程
+_SELECTABLE_PIPES = sys.platform != "win32"
+# Windows 控制台只有经 sys.stdout 的缓冲层调用 WriteConsoleW 才能正确显示 Unicode,
+# 直接写文件描述符时控制台会按代码页解码 UTF-8 字节导致乱码
+_DIRECT_OUTPUT = sys.platform != "win32"
+# 单次 writev 调用允许的最大数据块数
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if "SC_IOV_MAX" in getattr(os, "sysconf_names", {}) else 1024
+# 未换行的内容等待超过该时间(秒)即输出,同时作为事件循环的等待超时
+_IDLE_TIMEOUT = 0.05
+
+
+# 预过滤字面量的最短长度,过短的片段几乎总能命中,起不到过滤作用
+_MIN_LITERAL_LEN = 3
+# 预过滤字面量不超过该数量时先逐个检查字面量,更多时逐个检查的开销高于一次 hyperscan 扫描
+_MAX_LITERAL_CHECKS = 8
+
+
+# 预编译的替换模板: 纯文本模板为字符串,含分组引用的模板为根据匹配结果拼接的函数
+Template = str | Callable[[re.Match[str]], str]
+
+
+# 预编译规则结构: 同一 (locale, commands) 下的多条规则合并为一个交替表达式
 @dataclass
-class ReplacementRule:
-	__slots__ = ("commands", "locale", "pattern", "replacement")
+class FusedRule:
+	__slots__ = ("anchored", "commands", "literals", "locale", "pattern", "repls", "scanner")
 
 	def __init__(
 		self,
 		pattern: Pattern[str],
-		replacement: str,
+		repls: list[Template],
 		locale: str,
-		commands: list[str],
+		commands: frozenset[str],
+		literals: tuple[str, ...] = (),
+		scanner: Callable[[str], bool] | None = None,
+		*,
+		anchored: bool = False,
 	) -> None:
 		self.pattern = pattern
+		# 以各分支外层分组的序号 (即 Match.lastindex) 为下标的替换模板表
+		self.repls = repls
+		self.locale = locale
+		self.commands = commands
+		# 每个分支必定包含的字面量,为空表示无法预过滤
+		self.literals = literals
+		# 可选的 hyperscan 预过滤函数,返回 False 表示文本不可能匹配任一分支
+		self.scanner = scanner
+		# 所有分支都只能在文本开头匹配,只需在位置 0 尝试一次
+		self.anchored = anchored
+
+
+# 纯文本替换规则: 表达式与替换内容都不含特殊字符,使用 str.replace 代替正则
+@dataclass
+class LiteralRule:
+	__slots__ = ("commands", "literal", "locale", "replacement")
+
+	def __init__(
+		self,
+		literal: str,
+		replacement: str,
+		locale: str,
+		commands: frozenset[str],
+	) -> None:
+		self.literal = literal
 		self.replacement = replacement
 		self.locale = locale
 		self.commands = commands
 
 
+CompiledRule = LiteralRule | FusedRule
+# 规则的作用范围: (locale, 排序后的小写命令名)
+RuleKey = tuple[str, tuple[str, ...]]
+
+
+# 按命令名索引的规则集合,各列表均保持配置中的声明顺序
+@dataclass
+class RuleIndex:
+	__slots__ = ("by_command", "rules", "wildcard")
+
+	def __init__(self, rules: list[CompiledRule]) -> None:
+		self.rules = rules
+		# 未指定 filter_commands 的规则对所有命令生效
+		self.wildcard = [rule for rule in rules if not rule.commands]
+		self.by_command: dict[str, list[CompiledRule]] = {}
+		for command in {command for rule in rules for command in rule.commands}:
+			self.by_command[command] = [rule for rule in rules if not rule.commands or command in rule.commands]
+
+	def __len__(self) -> int:
+		return len(self.rules)
+
+
+@lru_cache(maxsize=4096)
+def _compile(pattern_str: str, flags: int = 0) -> Pattern[str]:
+	"""编译正则表达式并缓存结果,重复加载相同规则时无需重新编译"""
+	return re.compile(pattern_str, flags)
+
+
 def load_config(file_path: Path) -> dict[str, Any]:
     """加载并验证JSON配置文件"""
     try:
-        with file_path.open(encoding="utf-8") as f:
-            config = json.load(f)
+        # 直接读取原始字节交给 JSON 解析器,省去文本包装层
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            chunks = []
+            while chunk := os.read(fd, 1 << 20):
+                chunks.append(chunk)
+        finally:
+            os.close(fd)
+        data = b"".join(chunks)
+        config = orjson.loads(data) if orjson is not None else json.loads(data)
         if not isinstance(config, dict):
             raise ValueError("配置文件格式错误: 根元素必须是字典")
     except Exception as e:
@@ -54,9 +189,402 @@ def load_config(file_path: Path) -> dict[str, Any]:
         return config
 
 
-def compile_replacements(replacements: list[dict[str, Any]]) -> list[ReplacementRule]:
-	"""编译正则表达式替换规则,使用类代替字典提高性能"""
-	compiled = []
+def _rebase_pattern(source: str, prefix: str, offset: int) -> str:
+	"""为命名分组加前缀并平移数字反向引用,使多条规则可以合并到同一个表达式中,无法改写时抛出 re.error"""
+	out = []
+	i = 0
+	n = len(source)
+	in_class = False
+	while i < n:
+		ch = source[i]
+		if ch == "\\":
+			# 分组引用 \N (以 0 开头或三位八进制数字为八进制转义,保持原样)
+			j = i + 1
+			if not in_class and j < n and source[j] in "123456789":
+				k = j + 1
+				if k < n and source[k].isdigit():
+					if source[j] in _OCTDIGITS and source[k] in _OCTDIGITS and k + 1 < n and source[k + 1] in _OCTDIGITS:
+						out.append(source[i : k + 2])
+						i = k + 2
+						continue
+					k += 1
+				number = offset + int(source[j:k])
+				# 超过两位数的 \NNN 会被解析为八进制转义,无法在合并后的表达式中引用
+				if number > 99:
+					raise re.error(f"合并后的分组引用超出范围: \\{number}")
+				out.append(f"(?:\\{number})")
+				i = k
+				continue
+			out.append(source[i : i + 2])
+			i += 2
+			continue
+		if in_class:
+			if ch == "]":
+				in_class = False
+			out.append(ch)
+			i += 1
+			continue
+		if ch == "[":
+			# 字符类开头的 ']' 和 '^]' 是普通字符
+			j = i + 1
+			if j < n and source[j] == "^":
+				j += 1
+			if j < n and source[j] == "]":
+				j += 1
+			out.append(source[i:j])
+			i = j
+			in_class = True
+			continue
+		if source.startswith("(?P<", i):
+			end = source.index(">", i)
+			out.append(f"(?P<{prefix}{source[i + 4 : end]}>")
+			i = end + 1
+			continue
+		if source.startswith("(?P=", i):
+			end = source.index(")", i)
+			out.append(f"(?P={prefix}{source[i + 4 : end]})")
+			i = end + 1
+			continue
+		if source.startswith("(?(", i):
+			end = source.index(")", i + 3)
+			ref = source[i + 3 : end]
+			ref = str(offset + int(ref)) if ref.isdigit() else prefix + ref
+			out.append(f"(?({ref})")
+			i = end + 1
+			continue
+		out.append(ch)
+		i += 1
+	return "".join(out)
+
+
+def _required_literals(items: Any) -> tuple[str, ...]:
+	"""提取每次匹配都必定包含其中之一的字面量片段,无法提取时返回空元组"""
+	candidates: list[tuple[str, ...]] = []
+	current: list[str] = []
+
+	def end_run() -> None:
+		if len(current) >= _MIN_LITERAL_LEN:
+			candidates.append(("".join(current),))
+		current.clear()
+
+	def walk(items: Any) -> None:
+		for op, av in items:
+			if op is sre_parse.LITERAL:
+				current.append(chr(av))
+			elif op is sre_parse.AT:
+				# 零宽断言不消耗字符,不会打断字面量
+				continue
+			elif op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+				walk(av[-1])
+			else:
+				end_run()
+				# 每个分支都能提取到字面量时,文本至少包含其中之一
+				if op is sre_parse.BRANCH:
+					arms = [_required_literals(arm) for arm in av[1]]
+					if all(arms):
+						candidates.append(tuple(literal for arm in arms for literal in arm))
+
+	walk(items)
+	end_run()
+	if not candidates:
+		return ()
+	# 候选片段越少、最短片段越长,过滤效果越好
+	return max(candidates, key=lambda literals: (-len(literals), min(map(len, literals))))
+
+
+def _scoped_flags(items: Any) -> int:
+	"""收集表达式中所有局部内联标志 (?flags:...) 启用的标志"""
+	flags = 0
+	for op, av in items:
+		if op is sre_parse.SUBPATTERN:
+			flags |= av[1]
+		for sub in av if isinstance(av, tuple | list) else ():
+			for arm in sub if isinstance(sub, list) else (sub,):
+				if isinstance(arm, sre_parse.SubPattern):
+					flags |= _scoped_flags(arm)
+	return flags
+
+
+def _anchored_at_start(items: Any, multiline: bool) -> bool:
+	"""判断表达式是否只能从文本开头开始匹配"""
+	for op, av in items:
+		if op is sre_parse.AT:
+			if av is sre_parse.AT_BEGINNING_STRING or (av is sre_parse.AT_BEGINNING and not multiline):
+				return True
+			# 其他零宽断言不消耗字符,继续检查后续内容
+			continue
+		if op is sre_parse.SUBPATTERN:
+			_group, add_flags, del_flags, sub = av
+			sub_multiline = (multiline or bool(add_flags & re.MULTILINE)) and not del_flags & re.MULTILINE
+			return _anchored_at_start(sub, sub_multiline)
+		if op is sre_parse.BRANCH:
+			return all(_anchored_at_start(arm, multiline) for arm in av[1])
+		return False
+	return False
+
+
+@lru_cache(maxsize=4096)
+def _analyze_pattern(pattern_str: str) -> tuple[int, int, bool, tuple[str, ...]]:
+	"""解析一次表达式,语法错误时抛出 re.error
+
+	返回 (分组数, 任意位置启用过的标志, 是否锚定在文本开头, 按选择性从高到低排列的预过滤字面量)。
+	"""
+	parsed = sre_parse.parse(pattern_str)
+	global_flags = parsed.state.flags
+	anchored = _anchored_at_start(parsed, bool(global_flags & re.MULTILINE))
+	# 忽略大小写的表达式无法预过滤;越长的字面量越少出现在无关文本中,命中时也越可能真正匹配,优先检查
+	literals = () if global_flags & re.IGNORECASE else _required_literals(parsed)
+	flags = global_flags | _scoped_flags(parsed)
+	return parsed.state.groups - 1, flags, anchored, tuple(sorted(literals, key=len, reverse=True))
+
+
+def _rebase_template(template: str, prefix: str, offset: int) -> str:
+	"""将替换模板中的分组引用改写为合并后表达式中的分组"""
+
+	def rebase(m: re.Match[str]) -> str:
+		name, _octal, number = m.groups()
+		if number is not None:
+			return f"\\g<{offset + int(number)}>"
+		if name is None:
+			return m.group()
+		if name.isdigit():
+			return f"\\g<{offset + int(name)}>"
+		return f"\\g<{prefix}{name}>"
+
+	return _TEMPLATE_ESCAPE_RE.sub(rebase, template)
+
+
+def _pcre_pattern(pattern_str: str) -> str | None:
+	"""将 Python 表达式改写为 hyperscan 使用的 PCRE 语法,改写只会放宽匹配范围,无法保证时返回 None
+
+	单词边界依赖 \\w 的定义,直接去掉。忽略大小写的折叠规则和冗长模式的语法差异较大,这类表达式不做改写。
+	"""
+	if _analyze_pattern(pattern_str)[1] & (re.IGNORECASE | re.VERBOSE):
+		return None
+	out = []
+	i = 0
+	n = len(pattern_str)
+	# 当前所在字符类是否取反,不在字符类中时为 None
+	negated = None
+	while i < n:
+		ch = pattern_str[i]
+		if ch == "\\":
+			escape = pattern_str[i + 1 : i + 2]
+			if escape in ("u", "U", "N"):
+				# PCRE 不支持 \u、\U、\N{...} 转义,由 Python 解析后改写为字符本身,ASCII 字符写为 \xHH
+				end = pattern_str.index("}", i) + 1 if escape == "N" else i + (6 if escape == "u" else 10)
+				code = sre_parse.parse(pattern_str[i:end])[0][1]
+				out.append(f"\\x{code:02x}" if code < 0x80 else chr(code))
+				i = end
+				continue
+			if negated is None:
+				if escape in _PCRE_WIDE_ESCAPES:
+					out.append(f"[{_PCRE_WIDE_ESCAPES[escape]}]")
+				elif escape not in "bB":
+					out.append(pattern_str[i : i + 2])
+			elif not negated:
+				out.append(_PCRE_WIDE_ESCAPES.get(escape, pattern_str[i : i + 2]))
+			elif escape in _PCRE_NARROW_ESCAPES:
+				out.append(_PCRE_NARROW_ESCAPES[escape])
+			elif escape in _PCRE_WIDE_ESCAPES:
+				return None
+			else:
+				out.append(pattern_str[i : i + 2])
+			i += 2
+			continue
+		if negated is not None:
+			if ch == "]":
+				negated = None
+			out.append(ch)
+			i += 1
+			continue
+		if ch == "[":
+			# 字符类开头的 ']' 和 '^]' 是普通字符
+			j = i + 1
+			negated = j < n and pattern_str[j] == "^"
+			if negated:
+				j += 1
+			if j < n and pattern_str[j] == "]":
+				j += 1
+			out.append(pattern_str[i:j])
+			i = j
+			continue
+		if m := _OPEN_MIN_REPEAT_RE.match(pattern_str, i):
+			out.append(f"{{0,{m.group(1)}}}")
+			i = m.end()
+			continue
+		out.append(ch)
+		i += 1
+	return "".join(out)
+
+
+def _hyperscan_scanner(patterns: list[str]) -> Callable[[str], bool] | None:
+	"""用 hyperscan 编译预过滤数据库,返回判断文本是否可能匹配任一表达式的函数
+
+	hyperscan 不支持分组捕获,这里以 HS_FLAG_PREFILTER 模式编译经 _pcre_pattern 放宽的表达式,
+	命中后仍由 re 完成实际替换。有表达式无法安全改写或编译时返回 None,该组规则不使用 hyperscan。
+	"""
+	expressions = [_pcre_pattern(pattern_str) for pattern_str in patterns]
+	if None in expressions:
+		return None
+	flags = (
+		hyperscan.HS_FLAG_UTF8
+		| hyperscan.HS_FLAG_UCP
+		| hyperscan.HS_FLAG_PREFILTER
+		| hyperscan.HS_FLAG_SINGLEMATCH
+		| hyperscan.HS_FLAG_ALLOWEMPTY
+	)
+	db = hyperscan.Database()
+	try:
+		db.compile(
+			expressions=[expression.encode() for expression in expressions],
+			ids=list(range(len(expressions))),
+			elements=len(expressions),
+			flags=[flags] * len(expressions),
+		)
+	except hyperscan.error as e:
+		print(f"hyperscan 无法编译规则,改用 re 引擎: {e}", file=sys.stderr)
+		return None
+
+	def stop(*_: Any) -> bool:
+		# 返回 True 使扫描在首次命中后立即终止
+		return True
+
+	def may_match(text: str) -> bool:
+		try:
+			db.scan(text.encode(), match_event_handler=stop)
+		except hyperscan.ScanTerminated:
+			return True
+		return False
+
+	return may_match
+
+
+def _compile_template(template: str, pattern: Pattern[str]) -> Template:
+	"""预先解析替换模板,避免每次替换时由 Match.expand 重新解析
+
+	模板中的分组引用需已由 _rebase_template 改写为 \\g<...> 形式。无法解析的模板
+	退回 Match.expand,错误在应用时照常报告。
+	"""
+	literals = []
+	indices = []
+	pos = 0
+	try:
+		for m in _TEMPLATE_ESCAPE_RE.finditer(template):
+			ref = m.group(1)
+			if ref is None:
+				# 其他转义连同相邻文本一起交给 expand 处理
+				continue
+			index = int(ref) if ref.isdigit() else pattern.groupindex[ref]
+			if index > pattern.groups:
+				raise IndexError(index)
+			literals.append(_EMPTY_MATCH.expand(template[pos : m.start()]))
+			indices.append(index)
+			pos = m.end()
+		literals.append(_EMPTY_MATCH.expand(template[pos:]))
+	except (re.error, LookupError):
+		return lambda m: m.expand(template)
+
+	if not indices:
+		return literals[0]
+	if len(indices) == 1:
+		head, tail = literals
+		index = indices[0]
+		return lambda m: head + (m.group(index) or "") + tail
+
+	first = literals[0]
+	rest = literals[1:]
+	group_indices = tuple(indices)
+
+	def expand(m: re.Match[str]) -> str:
+		out = [first]
+		for value, literal in zip(m.group(*group_indices), rest):
+			out.append(value or "")
+			out.append(literal)
+		return "".join(out)
+
+	return expand
+
+
+def _split_global_flags(pattern_str: str) -> tuple[str, str]:
+	"""拆分表达式开头的全局内联标志,返回 (标志字母, 其余部分)"""
+	flags = ""
+	while m := _GLOBAL_FLAGS_RE.match(pattern_str):
+		flags += m.group(1)
+		pattern_str = pattern_str[m.end() :]
+	return flags, pattern_str
+
+
+def _overlaps(a: RuleKey, b: RuleKey) -> bool:
+	"""判断两组规则是否可能作用于同一命令"""
+	(locale_a, commands_a), (locale_b, commands_b) = a, b
+	return locale_a == locale_b and (not commands_a or not commands_b or not set(commands_a).isdisjoint(commands_b))
+
+
+def _fuse_rules(
+	rules: list[tuple[str, str, int]],
+	locale: str,
+	commands: frozenset[str],
+	engine: str,
+	*,
+	ascii_mode: bool = False,
+) -> FusedRule:
+	"""将同一 (locale, commands) 下的规则合并为单个交替表达式,无法合并时抛出 re.error
+
+	ascii_mode 为 True 时整个表达式以 re.ASCII 编译。
+	"""
+	alternatives = []
+	repls = [""]
+	literals = []
+	anchored = True
+	offset = 1
+	for index, (pattern_str, replacement, group_count) in enumerate(rules):
+		prefix = f"r{index}_"
+		_groups, _flags, alt_anchored, alt_literals = _analyze_pattern(pattern_str)
+		anchored = anchored and alt_anchored
+		literals.append(alt_literals)
+		# 将开头的全局内联标志转换为作用域标志
+		flags, pattern_str = _split_global_flags(pattern_str)
+		body = _rebase_pattern(pattern_str, prefix, offset)
+		if flags:
+			# 冗长模式下表达式可能以 # 注释结尾,换行后再闭合分组
+			body = f"(?{flags}:{body}\n)" if "x" in flags else f"(?{flags}:{body})"
+		alternatives.append(f"(?P<r{index}>{body})")
+		# 分支内部的分组在模板表中占位,使外层分组序号可直接作为下标
+		repls.append(_rebase_template(replacement, prefix, offset))
+		repls.extend([""] * group_count)
+		offset += 1 + group_count
+
+	pattern = _compile("|".join(alternatives), re.ASCII if ascii_mode else 0)
+	templates = [_compile_template(template, pattern) for template in repls]
+	# 只要有一个分支提取不到字面量,整组规则就不能预过滤
+	prefilter = ()
+	if all(literals):
+		prefilter = tuple(sorted(dict.fromkeys(lit for alt in literals for lit in alt), key=len, reverse=True))
+	scanner = None
+	# 只在开头匹配的规则一次 match 即可判定,额外的预过滤只会增加开销
+	if engine == "hyperscan" and not anchored:
+		scanner = _hyperscan_scanner([pattern_str for pattern_str, *_ in rules])
+	return FusedRule(pattern, templates, locale, commands, prefilter, scanner, anchored=anchored)
+
+
+def compile_replacements(replacements: list[dict[str, Any]], engine: str = "re") -> RuleIndex:
+	"""按声明顺序编译替换规则: 纯文本规则保持原位置,其余规则按 (locale, commands) 合并为单个交替表达式
+
+	合并不会改变规则的执行顺序: 可能作用于同一命令的其他规则之后出现的规则另起一组。
+
+	engine 为 "hyperscan" 时,额外为每组规则编译 hyperscan 预过滤数据库。
+	规则可以通过 "ascii": true 要求以 ASCII 模式匹配。
+	"""
+	if engine == "hyperscan" and hyperscan is None:
+		print(f"警告: 未安装 {engine},改用 re 引擎", file=sys.stderr)
+		engine = "re"
+
+	# 按声明顺序排列的规则单元: 纯文本规则,或可合并为一个交替表达式的正则规则列表
+	units: list[tuple[tuple[RuleKey, bool], LiteralRule | list[tuple[str, str, int]]]] = []
+	# 仍可追加规则的正则规则列表。之后出现的规则若可能作用于同一命令,
+	# 再向前面的列表追加规则会改变执行顺序,因此关闭这些列表
+	open_runs: dict[tuple[RuleKey, bool], list[tuple[str, str, int]]] = {}
 	for rule in replacements:
 		pattern_str = rule.get("pattern")
 		replacement = rule.get("replacement")
@@ -67,121 +595,431 @@ def compile_replacements(replacements: list[dict[str, Any]]) -> list[Replacement
 			print("警告: 规则缺少必要字段 'pattern' 或 'replacement'", file=sys.stderr)
 			continue
 
+		# 只解析不编译: 编译阶段才能发现的错误 (如不定长的后行断言) 在合并失败后逐条编译时报告
 		try:
-			pattern = re.compile(pattern_str)
-			# 统一命令名为小写
-			norm_commands = [cmd.lower() for cmd in commands]
-			compiled.append(ReplacementRule(pattern, replacement, locale, norm_commands))
+			group_count = _analyze_pattern(pattern_str)[0]
 		except re.error as e:
 			print(f"无效的正则表达式 '{pattern_str}': {e}", file=sys.stderr)
+			continue
+		# 显式要求 ASCII 模式的规则单独成组并以 re.ASCII 编译: 局部标志 (?a:...) 对 \\W、\\D、\\S
+		# 等取反的字符类不起作用。已显式指定 (?u) 或 (?L) 的规则忽略该字段
+		ascii_mode = bool(rule.get("ascii", False)) and not set(_split_global_flags(pattern_str)[0]) & set("uL")
 
-	return compiled
-
+		# 统一命令名为小写
+		key = (locale, tuple(sorted({cmd.lower() for cmd in commands})))
+		run_key = (key, ascii_mode)
+		unit: LiteralRule | list[tuple[str, str, int]]
+		if "\\" not in replacement and _METACHARS.isdisjoint(pattern_str):
+			unit = LiteralRule(pattern_str, replacement, locale, frozenset(key[1]))
+		elif run_key in open_runs:
+			open_runs[run_key].append((pattern_str, replacement, group_count))
+			continue
+		else:
+			unit = [(pattern_str, replacement, group_count)]
+		for other in [other for other in open_runs if _overlaps(other[0], key)]:
+			del open_runs[other]
+		if isinstance(unit, list):
+			open_runs[run_key] = unit
+		units.append((run_key, unit))
 
-def apply_replacements(
-	text: str,
-	command_name: str,
-	replacements: list[ReplacementRule],
-	locale: str = "default",
-) -> str:
-	"""应用所有匹配的替换规则到文本"""
-	command_name = command_name.lower()
-	for rule in replacements:
-		# 快速跳过不匹配的规则
-		if rule.commands and command_name not in rule.commands:
+	compiled: list[CompiledRule] = []
+	for ((locale, commands), ascii_mode), unit in units:
+		if isinstance(unit, LiteralRule):
+			compiled.append(unit)
 			continue
-		if rule.locale != locale:
+		try:
+			compiled.append(_fuse_rules(unit, locale, frozenset(commands), engine, ascii_mode=ascii_mode))
+		except re.error:
+			# 合并失败时逐条编译,单条规则出错不影响同组的其他规则
+			for rule in unit:
+				try:
+					compiled.append(_fuse_rules([rule], locale, frozenset(commands), engine, ascii_mode=ascii_mode))
+				except re.error as e:
+					print(f"合并正则表达式时出错 '{rule[0]}': {e}", file=sys.stderr)
+
+	return RuleIndex(compiled)
+
+
+def filter_rules(index: RuleIndex, command_name: str, locale: str = "default") -> list[CompiledRule]:
+	"""筛选适用于当前命令和语言环境的规则,在子进程生命周期内只需执行一次"""
+	rules = index.by_command.get(command_name.lower(), index.wildcard)
+	return [rule for rule in rules if rule.locale == locale]
+
+
+def build_applier(replacements: list[CompiledRule]) -> Callable[[str], str]:
+	"""为筛选后的规则生成专用的替换函数,省去逐条规则的属性访问和类型分派
+
+	纯文本规则用 str.replace 替换;正则规则在预过滤判定可能匹配时,锚定在开头的只 match 一次,
+	其余的单次 finditer 扫描并拼接替换结果。字面量和替换内容直接内联为常量,
+	正则规则的 match/finditer 和模板表通过默认参数绑定为局部变量。
+	"""
+	params = ["text"]
+	body = []
+	for index, rule in enumerate(replacements):
+		if isinstance(rule, LiteralRule):
+			body.append(f"text = text.replace({rule.literal!r}, {rule.replacement!r})")
 			continue
-		text = rule.pattern.sub(rule.replacement, text)
-	return text
 
+		params.append(f"repls{index}=_rules[{index}].repls")
+		if rule.anchored:
+			params.append(f"match{index}=_rules[{index}].pattern.match")
+			block = [
+				f"m = match{index}(text)",
+				"if m:",
+				f"\ttemplate = repls{index}[m.lastindex]",
+				"\ttext = (template if template.__class__ is str else template(m)) + text[m.end() :]",
+			]
+		else:
+			params.append(f"finditer{index}=_rules[{index}].pattern.finditer")
+			block = [
+				"out = []",
+				"pos = 0",
+				f"for m in finditer{index}(text):",
+				"\tout.append(text[pos : m.start()])",
+				f"\ttemplate = repls{index}[m.lastindex]",
+				"\tout.append(template if template.__class__ is str else template(m))",
+				"\tpos = m.end()",
+				"if out:",
+				"\tout.append(text[pos:])",
+				"\ttext = ''.join(out)",
+			]
+		# 字面量较少时先做开销最小的字面量检查,通过后才调用 hyperscan 预过滤函数;
+		# 字面量较多时直接由预过滤函数判断
+		conditions = []
+		if rule.literals and (rule.scanner is None or len(rule.literals) <= _MAX_LITERAL_CHECKS):
+			conditions.append("(" + " or ".join(f"{literal!r} in text" for literal in rule.literals) + ")")
+		if rule.scanner is not None:
+			params.append(f"scanner{index}=_rules[{index}].scanner")
+			conditions.append(f"scanner{index}(text)")
+		if conditions:
+			body.append(f"if {' and '.join(conditions)}:")
+			block = ["\t" + line for line in block]
+		body.extend(block)
+	body.append("return text")
 
-def process_stream(
-	stream: TextIO,
-	command_name: str,
-	replacements: list[ReplacementRule],
-	output_stream: TextIO,
-	locale: str = "default",
-) -> None:
-	"""处理流数据并应用替换规则,优化缓冲区处理"""
+	source = f"def apply({', '.join(params)}):\n" + "".join(f"\t{line}\n" for line in body)
+	namespace: dict[str, Any] = {"_rules": replacements}
+	exec(compile(source, "<clitheme-rules>", "exec"), namespace)  # noqa: S102
+	return namespace["apply"]
+
+
+def cache_lines(apply: Callable[[str], str]) -> Callable[[str], str]:
+	"""为替换函数加上按行的 LRU 缓存,重复出现的行(进度条、提示符等)直接返回缓存结果
+
+	超过 _LINE_CACHE_MAX_LEN 的长行不参与缓存,以限制内存占用。
+	"""
+	cached = lru_cache(maxsize=_LINE_CACHE_SIZE)(apply)
+
+	def apply_cached(text: str) -> str:
+		if len(text) > _LINE_CACHE_MAX_LEN:
+			return apply(text)
+		return cached(text)
+
+	return apply_cached
+
+
+def _apply_safely(text: str, apply: Callable[[str], str]) -> str:
+	"""应用替换函数,出错时返回原文本"""
+	try:
+		return apply(text)
+	except Exception as e:
+		print(f"处理输出时出错: {e}", file=sys.stderr)
+		return text
+
+
+def _write_all(fd: int, data: bytes | memoryview) -> None:
+	"""将数据完整写入文件描述符"""
+	view = memoryview(data)
+	while view:
+		view = view[os.write(fd, view) :]
+
+
+def _write_chunks(fd: int, chunks: list[bytes]) -> None:
+	"""以聚集写入 (writev) 一次性输出多个数据块,仅在直接写文件描述符的平台上使用"""
+	index = 0
+	while index < len(chunks):
+		written = os.writev(fd, chunks[index : index + _IOV_MAX])
+		# 跳过已完整写入的数据块,部分写入的数据块去掉已写出的部分
+		while index < len(chunks) and written >= len(chunks[index]):
+			written -= len(chunks[index])
+			index += 1
+		if written:
+			chunks[index] = chunks[index][written:]
+
+
+class StreamProcessor:
+	"""增量处理单个输出流的数据,按行应用替换规则后直接写入输出流的文件描述符
+
+	Windows 上改为写入输出流的二进制缓冲层,由其处理控制台输出。
+	"""
+
+	__slots__ = ("apply", "buffer", "decoder", "encoding", "fd", "pending_since", "tail")
+
+	def __init__(self, apply: Callable[[str], str], output_stream: TextIO) -> None:
+		self.apply = apply
+		# 之后绕过 output_stream 的文本层写入,先输出其中已缓冲的内容
+		output_stream.flush()
+		self.fd = output_stream.fileno()
+		self.buffer = None if _DIRECT_OUTPUT else output_stream.buffer
+		self.encoding = output_stream.encoding or "utf-8"
+		self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+		# 尚未换行的内容按读取顺序分段保存,遇到换行时才拼接,避免长行被反复复制
+		self.tail: list[str] = []
+		# 当前未换行内容开始等待输出的时间,没有未换行内容时为 None
+		self.pending_since: float | None = None
+
+	def feed(self, chunk: bytes) -> None:
+		"""处理新读取的数据块,未换行的部分留待后续数据"""
+		lines = self.decoder.decode(chunk).split("\n")
+		rest = lines.pop()
+		if lines:
+			if self.tail:
+				self.tail.append(lines[0])
+				lines[0] = "".join(self.tail)
+				self.tail.clear()
+			encoding = self.encoding
+			self.write([self.process(line).encode(encoding, "replace") for line in lines])
+			self.pending_since = None
+		if rest:
+			self.tail.append(rest)
+			if self.pending_since is None:
+				self.pending_since = time.monotonic()
+
+	def process(self, line: str) -> str:
+		"""对去掉换行符的一行应用替换规则,CRLF 换行去掉 \r 后再匹配,输出时恢复"""
+		if line[-1:] != "\r":
+			return _apply_safely(line + "\n", self.apply)
+		processed = _apply_safely(line[:-1] + "\n", self.apply)
+		return processed[:-1] + "\r\n" if processed[-1:] == "\n" else processed
+
+	def write(self, chunks: list[bytes]) -> None:
+		"""输出编码后的数据块"""
+		if self.buffer is None:
+			_write_chunks(self.fd, chunks)
+			return
+		# 二进制缓冲层不做换行符转换,子进程输出的 CRLF 原样保留
+		self.buffer.write(b"".join(chunks))
+		self.buffer.flush()
+
+	def flush_if_idle(self, now: float) -> None:
+		"""未换行的内容等待超过 _IDLE_TIMEOUT 时输出(如交互式提示符、以 \r 刷新的进度条)
+
+		按等待时间而不是最后一次读取的时间判断,持续输出但不换行的内容也不会被一直扣留。
+		"""
+		if self.pending_since is not None and now - self.pending_since >= _IDLE_TIMEOUT:
+			self.flush()
+
+	def flush(self, *, final: bool = False) -> None:
+		"""输出尚未换行的内容"""
+		if final:
+			self.tail.append(self.decoder.decode(b"", final=True))
+		tail = "".join(self.tail)
+		self.tail.clear()
+		if tail:
+			self.write([_apply_safely(tail, self.apply).encode(self.encoding, "replace")])
+		self.pending_since = None
+
+
+class SelectReader:
+	"""用 select 等待多个管道就绪,在调用线程中读取数据块"""
+
+	__slots__ = ("selector",)
+
+	def __init__(self, fds: list[int]) -> None:
+		# 标准输入可能被重定向为普通文件,epoll 无法注册普通文件,而 select 可以;
+		# 只监听三个文件描述符时两者性能相同
+		self.selector = selectors.SelectSelector()
+		for fd in fds:
+			self.watch(fd)
+
+	def read(self, timeout: float) -> list[tuple[int, bytes | None]]:
+		"""等待至多 timeout 秒,返回就绪管道的 (fd, 数据块),空数据块表示流结束,None 表示管道可写"""
+		return [
+			(key.fd, os.read(key.fd, _READ_SIZE) if mask & selectors.EVENT_READ else None)
+			for key, mask in self.selector.select(timeout)
+		]
+
+	def watch(self, fd: int, *, writable: bool = False) -> None:
+		"""开始监听管道可读,writable 为 True 时改为监听可写"""
+		self.selector.register(fd, selectors.EVENT_WRITE if writable else selectors.EVENT_READ)
+
+	def discard(self, fd: int) -> None:
+		"""停止监听指定的管道"""
+		if fd in self.selector.get_map():
+			self.selector.unregister(fd)
+
+	def close(self) -> None:
+		self.selector.close()
+
+
+def _pump(fd: int, queue: deque[bytes], wakeup: threading.Event) -> None:
+	"""读取线程: 只负责把数据块追加到该管道独占的队列,空数据块表示流结束"""
 	while True:
-		line = stream.readline()
-		if not line:
-			break
+		try:
+			chunk = os.read(fd, _READ_SIZE)
+		except OSError:
+			chunk = b""
+		queue.append(chunk)
+		wakeup.set()
+		if not chunk:
+			return
+
 
+class ThreadedReader:
+	"""管道无法被 select 监听的平台 (Windows) 上,每个管道由一个读取线程写入单生产者单消费者队列
+
+	deque 的 append 和 popleft 在 CPython 中是原子操作,读取线程与主线程之间无需加锁;
+	Event 只用于在队列为空时唤醒主线程。
+	"""
+
+	__slots__ = ("queues", "wakeup")
+
+	def __init__(self, fds: list[int]) -> None:
+		self.wakeup = threading.Event()
+		self.queues: dict[int, deque[bytes]] = {}
+		for fd in fds:
+			queue: deque[bytes] = deque()
+			self.queues[fd] = queue
+			threading.Thread(target=_pump, args=(fd, queue, self.wakeup), daemon=True).start()
+
+	def read(self, timeout: float) -> list[tuple[int, bytes | None]]:
+		"""等待至多 timeout 秒,返回各管道已读取的 (fd, 数据块),空数据块表示流结束"""
+		self.wakeup.wait(timeout)
+		# 先清除再取数据: 之后追加的数据会重新设置 Event,不会丢失唤醒
+		self.wakeup.clear()
+		events = []
+		for fd, queue in self.queues.items():
+			while queue:
+				events.append((fd, queue.popleft()))
+		return events
+
+	def discard(self, fd: int) -> None:
+		"""丢弃指定管道之后的数据,仍阻塞在读取上的守护线程随进程退出"""
+		del self.queues[fd]
+
+	def close(self) -> None:
+		self.queues.clear()
+
+
+def process_streams(proc: subprocess.Popen[bytes], apply: Callable[[str], str]) -> None:
+	"""在主线程的事件循环中处理子进程的输出,交互模式下同时转发标准输入"""
+	assert proc.stdout is not None
+	assert proc.stderr is not None
+	processors = {
+		proc.stdout.fileno(): StreamProcessor(apply, sys.stdout),
+		proc.stderr.fileno(): StreamProcessor(apply, sys.stderr),
+	}
+	stdin_fd = sys.stdin.fileno() if proc.stdin else None
+	fds = list(processors) if stdin_fd is None else [*processors, stdin_fd]
+	reader = SelectReader(fds) if _SELECTABLE_PIPES else ThreadedReader(fds)
+	# 子进程输入管道写满时暂存未写出的数据,期间停止读取标准输入,等管道可写后继续写入;
+	# 阻塞写入会在子进程同时写满输出管道时互相等待。读取线程模式下输出始终有线程读取,直接阻塞写入即可
+	backlog = bytearray()
+	if proc.stdin and _SELECTABLE_PIPES:
+		os.set_blocking(proc.stdin.fileno(), False)
+
+	def close_stdin() -> None:
+		nonlocal stdin_fd
+		if stdin_fd is not None and proc.stdin:
+			if backlog:
+				backlog.clear()
+				reader.discard(proc.stdin.fileno())
+			reader.discard(stdin_fd)
+			stdin_fd = None
+			proc.stdin.close()
+
+	def forward(chunk: bytes) -> None:
+		"""将标准输入的数据写入子进程,管道已满时暂存剩余部分"""
+		assert proc.stdin is not None
+		if not _SELECTABLE_PIPES:
+			_write_all(proc.stdin.fileno(), chunk)
+			return
 		try:
-			processed = apply_replacements(line, command_name, replacements, locale)
-			# 立即输出处理后的行,而不是使用缓冲区
-			output_stream.write(processed)
-			output_stream.flush()
-		except Exception as e:
-			print(f"处理输出时出错: {e}", file=sys.stderr)
-			output_stream.write(line)
-			output_stream.flush()
+			written = os.write(proc.stdin.fileno(), chunk)
+		except BlockingIOError:
+			written = 0
+		if written < len(chunk):
+			backlog.extend(memoryview(chunk)[written:])
+			reader.discard(stdin_fd)
+			reader.watch(proc.stdin.fileno(), writable=True)
+
+	def drain() -> None:
+		"""子进程输入管道可写时继续写入暂存的数据,写完后恢复读取标准输入"""
+		assert proc.stdin is not None
+		try:
+			del backlog[: os.write(proc.stdin.fileno(), backlog)]
+		except BlockingIOError:
+			return
+		if not backlog:
+			reader.discard(proc.stdin.fileno())
+			reader.watch(stdin_fd)
+
+	try:
+		while processors:
+			try:
+				events = reader.read(_IDLE_TIMEOUT)
+			except KeyboardInterrupt:
+				# 中断信号同样会发送给子进程,停止转发输入并继续处理剩余输出
+				close_stdin()
+				continue
+
+			for fd, chunk in events:
+				if chunk is None or fd == stdin_fd:
+					try:
+						if chunk is None:
+							# 同一批事件中输入可能已被关闭
+							if backlog:
+								drain()
+						elif chunk:
+							forward(chunk)
+						else:
+							close_stdin()
+					except OSError as e:
+						print(f"处理输入时出错: {e}", file=sys.stderr)
+						close_stdin()
+					continue
+
+				processor = processors.get(fd)
+				if processor is None:
+					continue
+				if chunk:
+					processor.feed(chunk)
+					continue
+				# 输出流结束
+				processor.flush(final=True)
+				reader.discard(fd)
+				del processors[fd]
+
+			now = time.monotonic()
+			for processor in processors.values():
+				processor.flush_if_idle(now)
+	finally:
+		reader.close()
 
 
 def execute_command(
 	command: list[str],
-	replacements: list[ReplacementRule],
+	replacements: RuleIndex,
 	locale: str = "default",
 ) -> int:
 	"""执行命令并处理输出,优化交互式命令处理"""
 	try:
 		command_name = Path(command[0]).name
+		# 命令名和语言环境在子进程运行期间不变,预先筛选规则
+		apply = cache_lines(build_applier(filter_rules(replacements, command_name, locale)))
 		is_interactive = command_name.lower() in {"python", "python3", "ipython", "bash", "sh", "cmd", "zsh"}
 
 		# 使用上下文管理器确保资源释放
 		with subprocess.Popen(  # noqa: S603
-			command if not is_interactive else [" ".join(command)],
+			command,
 			stdout=subprocess.PIPE,
 			stderr=subprocess.PIPE,
 			stdin=subprocess.PIPE if is_interactive else None,
-			text=True,
-			bufsize=1,
-			encoding="utf-8",
-			errors="replace",
-			shell=is_interactive,
+			# 以字节模式打开无缓冲管道,由 StreamProcessor 按块解码
+			bufsize=0,
 		) as proc:
-			# 创建处理输出的线程
-			stdout_thread = threading.Thread(
-				target=process_stream,
-				args=(proc.stdout, command_name, replacements, sys.stdout, locale),
-				daemon=True,
-			)
-			stderr_thread = threading.Thread(
-				target=process_stream,
-				args=(proc.stderr, command_name, replacements, sys.stderr, locale),
-				daemon=True,
-			)
-
-			stdout_thread.start()
-			stderr_thread.start()
-
-			# 处理交互式输入
-			if is_interactive and proc.stdin:
-				try:
-					while proc.poll() is None:
-						try:
-							input_line = sys.stdin.readline()
-							if not input_line:
-								break
-							proc.stdin.write(input_line)
-							proc.stdin.flush()
-						except (KeyboardInterrupt, EOFError):
-							break
-				except Exception as e:
-					print(f"处理输入时出错: {e}", file=sys.stderr)
-				finally:
-					proc.stdin.close()
-
-			# 等待进程结束
-			return_code = proc.wait()
-
-			# 等待输出线程结束
-			stdout_thread.join(2.0)
-			stderr_thread.join(2.0)
-
-			return return_code
+			process_streams(proc, apply)
+			return proc.wait()
 
 	except FileNotFoundError:
 		print(f"错误: 找不到命令 '{command[0]}'", file=sys.stderr)
@@ -199,6 +1037,12 @@ def main() -> None:
     )
     parser.add_argument("-apply", dest="config_file", required=True, help="包含替换规则的JSON配置文件")
     parser.add_argument("--locale", default="default", help="指定使用的语言环境(默认为 'default')")
+    parser.add_argument(
+        "--engine",
+        choices=("re", "hyperscan"),
+        default="re",
+        help="规则预过滤引擎(默认为 're'); 'hyperscan' 需要安装同名的可选依赖",
+    )
     parser.add_argument("command", nargs=argparse.REMAINDER, help="要执行的命令及其参数")
 
     if len(sys.argv) == 1:
@@ -224,9 +1068,9 @@ def main() -> None:
         sys.exit(1)
 
     config = load_config(config_path)
-    replacements = []
+    replacements = RuleIndex([])
     if "replacements" in config and isinstance(config["replacements"], list):
-        replacements = compile_replacements(config["replacements"])
+        replacements = compile_replacements(config["replacements"], args.engine)
 
     # 如果没有替换规则，直接代理命令
     if not replacements:
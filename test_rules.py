@@ -0,0 +1,198 @@
+# 替换规则编译测试: 合并后的规则与逐条 re.sub 的结果应一致;输出处理测试: 管道读写的边界情况
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import clitheme
+
+# 互不重叠的规则,覆盖命名分组、数字反向引用、条件分组、内联标志和各类模板引用
+RULES = [
+    {"pattern": r"^Traceback \(most recent call last\):", "replacement": "出错啦:"},
+    {"pattern": r"(?P<name>\w+)Error: (?P<msg>.+)", "replacement": r"(\g<name>Error) \g<msg>喵"},
+    {"pattern": r"(\d+) \+ \1", "replacement": r"两个\1"},
+    {"pattern": r"(?i)warning", "replacement": "注意"},
+    {"pattern": r"(<)?tag(?(1)>|!)", "replacement": r"[\g<0>]"},
+    {"pattern": r"line (?P<n>\d+)(?P=n)", "replacement": r"第\g<n>行"},
+    {"pattern": r"[(?P<x>]+x", "replacement": r"\\字符类\n"},
+    {"pattern": r"(?x) Zzz  # sleepy", "replacement": "困了"},
+    {"pattern": r"\101BC", "replacement": "八进制"},
+]
+
+LINES = [
+    "Traceback (most recent call last):\n",
+    "NameError: name 'x' is not defined\n",
+    "12 + 12 and 3 + 4\n",
+    "WARNING: Warning warning\n",
+    "<tag> tag! <tag!\n",
+    "line 77 line 78\n",
+    "((P<x end\n",
+    "Zzz Zzz\n",
+    "ABC\n",
+    "nothing to see here\n",
+]
+
+
+def reference(text: str, rules: list[dict[str, str]]) -> str:
+    """未经合并的逐条替换"""
+    for rule in rules:
+        text = re.sub(rule["pattern"], rule["replacement"], text)
+    return text
+
+
+class FusedRuleTest(unittest.TestCase):
+    def test_fused_matches_per_rule_sub(self):
+        index = clitheme.compile_replacements(RULES)
+        self.assertEqual(len(index), 1)
+        apply = clitheme.build_applier(clitheme.filter_rules(index, "python3"))
+        for line in LINES:
+            with self.subTest(line=line):
+                self.assertEqual(apply(line), reference(line, RULES))
+
+    def test_group_falls_back_to_per_rule(self):
+        # 分组引用平移后超过 \99,整组无法合并时逐条编译,不能丢弃其他规则
+        rules = [{"pattern": "(a)" * 99, "replacement": "x"}, {"pattern": r"(b)\1", "replacement": "两个b"}, *RULES]
+        index = clitheme.compile_replacements(rules)
+        self.assertEqual(len(index), len(rules))
+        apply = clitheme.build_applier(clitheme.filter_rules(index, "python3"))
+        for line in [*LINES, "bb\n"]:
+            with self.subTest(line=line):
+                self.assertEqual(apply(line), reference(line, rules))
+
+    def test_declaration_order_is_kept(self):
+        # 纯文本规则与其他作用范围的规则穿插时,执行顺序仍与声明顺序一致
+        rules = [
+            {"pattern": r"^NameError: name '(.+)' is not defined", "replacement": r"(NameError): 主人～'\1'不存在喵"},
+            {"pattern": "Error", "replacement": "错误喵"},
+            {"pattern": r"(\d+)", "replacement": r"<\1>", "filter_commands": ["python3"]},
+            {"pattern": r"<(\d)>", "replacement": r"[\1]"},
+            {"pattern": r"\[(\d)\]", "replacement": r"{\1}", "filter_commands": ["python3"]},
+        ]
+        apply = clitheme.build_applier(clitheme.filter_rules(clitheme.compile_replacements(rules), "python3"))
+        for line in ["NameError: name 'x' is not defined\n", "TypeError 7\n"]:
+            with self.subTest(line=line):
+                self.assertEqual(apply(line), reference(line, rules))
+
+    def test_ascii_mode(self):
+        # "ascii": true 与 re.ASCII 语义一致;未声明该字段的规则保持 Unicode 语义
+        rules = [
+            {"pattern": r"[^\w]\W\D\S", "replacement": "非单词", "ascii": True},
+            {"pattern": r"(?i:k)elvin", "replacement": "开尔文"},
+        ]
+        apply = clitheme.build_applier(clitheme.filter_rules(clitheme.compile_replacements(rules), "sh"))
+        self.assertEqual(apply("éé\u0660\u3000\n"), "非单词\n")
+        self.assertEqual(apply("\u212aelvin\n"), "开尔文\n")
+
+    def test_prefilter_engines_do_not_skip_matches(self):
+        # hyperscan 与 Python 的语法和 Unicode 字符表不同,预过滤不能因此跳过会匹配的规则
+        rules = [
+            {"pattern": r"a{,2}b", "replacement": "Q"},
+            {"pattern": r"c{,}d", "replacement": "R"},
+            {"pattern": r"x\w+y", "replacement": "单词"},
+            {"pattern": r"p\sq", "replacement": "空白"},
+            {"pattern": r"m[^\d]n", "replacement": "非数字"},
+            {"pattern": r"(?i)kelvin", "replacement": "开尔文"},
+            {"pattern": r"\U0001F600 smile", "replacement": "笑"},
+            {"pattern": r"\N{CAT}[\u002e]", "replacement": "猫"},
+        ]
+        lines = [
+            "aab\n",
+            "cccd\n",
+            "x\U00030000y\n",
+            "p\x1cq\n",
+            "m\U00011450n\n",
+            "\u212aELVIN\n",
+            "\U0001F600 smile\n",
+            "\N{CAT}.\n",
+        ]
+        # Python 特有的转义改写为字符本身,预过滤表达式才能正常编译
+        self.assertEqual(clitheme._pcre_pattern(r"\U0001F600 smile"), "\U0001F600 smile")
+        self.assertEqual(clitheme._pcre_pattern(r"\N{CAT}[\u002e]"), "\N{CAT}[\\x2e]")
+        if clitheme.hyperscan is None:
+            self.skipTest("未安装 hyperscan")
+        apply = clitheme.build_applier(clitheme.filter_rules(clitheme.compile_replacements(rules, "hyperscan"), "sh"))
+        for line in lines:
+            with self.subTest(line=line):
+                self.assertEqual(apply(line), reference(line, rules))
+
+
+def read_all(fd: int) -> bytes:
+    """读取管道直到写端关闭"""
+    chunks = []
+    while chunk := os.read(fd, 65536):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class StreamTest(unittest.TestCase):
+    def test_stream_processor_split_utf8_and_crlf(self):
+        # 多字节字符被拆到两次读取中、CRLF 换行、未换行的结尾都应按行正确替换
+        apply = clitheme.build_applier(
+            clitheme.filter_rules(clitheme.compile_replacements([{"pattern": "^喵$", "replacement": "汪"}]), "sh"),
+        )
+        r, w = os.pipe()
+        with os.fdopen(r, "rb") as reader, open(w, "w", encoding="utf-8") as output:
+            processor = clitheme.StreamProcessor(apply, output)
+            data = "喵\r\n喵\n前缀喵\n喵".encode()
+            for i in range(len(data)):
+                processor.feed(data[i : i + 1])
+            processor.flush(final=True)
+            output.close()
+            self.assertEqual(reader.read(), "汪\r\n汪\n前缀喵\n汪".encode())
+
+    def test_write_chunks_partial_writes(self):
+        # writev 每次只写出一部分时,剩余数据应继续写入且顺序不变
+        real_writev = os.writev
+
+        def short_writev(fd, buffers):
+            return real_writev(fd, [b"".join(buffers)[:7]])
+
+        chunks = [b"abc", b"", b"defghijk", b"l" * 20, b"mn"]
+        expected = b"".join(chunks)
+        r, w = os.pipe()
+        try:
+            with mock.patch.object(clitheme.os, "writev", short_writev):
+                clitheme._write_chunks(w, list(chunks))
+        finally:
+            os.close(w)
+        self.assertEqual(read_all(r), expected)
+        os.close(r)
+
+    @unittest.skipIf(sys.platform == "win32", "需要 sh")
+    def test_process_streams_large_stdin(self):
+        # 子进程的输出远多于输入且输入超过管道容量时,转发输入不能与读取输出互相等待
+        line = b"x" * 100
+        data = b"f() { echo " + line + b"; }\n" + b"f\n" * 40000
+        expected = (line + b"\n") * 40000
+        with tempfile.TemporaryFile() as stdin, tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+            stdin.write(data)
+            stdin.seek(0)
+            streams = {
+                name: open(f.fileno(), mode, encoding="utf-8", closefd=False)
+                for name, f, mode in (("stdin", stdin, "r"), ("stdout", stdout, "w"), ("stderr", stderr, "w"))
+            }
+            with mock.patch.multiple(sys, **streams), subprocess.Popen(
+                ["sh"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0,
+            ) as proc:
+                worker = threading.Thread(target=clitheme.process_streams, args=(proc, str), daemon=True)
+                worker.start()
+                worker.join(20)
+                if worker.is_alive():
+                    proc.kill()
+                    self.fail("处理子进程输入输出时卡住")
+            for stream in streams.values():
+                stream.close()
+            stdout.seek(0)
+            self.assertEqual(stdout.read(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()